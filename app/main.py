@@ -3,7 +3,9 @@ Hospital Resource Utilization & Patient Outcomes API
 Backend: FastAPI for ETL & API. BI: Apache Superset (connect to same DB).
 """
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 from app.config import settings
 from app.routers import analytics, etl, alerts, exports, reports
@@ -12,11 +14,16 @@ app = FastAPI(
     title=settings.app_title,
     version=settings.app_version,
     description="ETL, analytics API, exports (CSV/Excel/PDF), and monthly reports for the Hospital Dashboard.",
+    default_response_class=ORJSONResponse,
 )
 
+# Added first so CORS is the outer layer and also decorates compressed responses.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=settings.cors_origin_list,
+    # With the default CORS_ORIGINS="*", Starlette echoes whatever Origin the request sends, so
+    # credentialed requests are accepted from any origin. Set CORS_ORIGINS to narrow this.
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -0,0 +1,77 @@
+"""
+Shared request-parameter types and endpoint helpers for the API routers.
+"""
+import functools
+import hashlib
+import inspect
+from datetime import date, timedelta
+from typing import Annotated, List, Optional, Tuple
+
+import orjson
+from fastapi import Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BeforeValidator
+
+
+def _split_ids(value):
+    """Accept both ?ids=1,2 and ?ids=1&ids=2; pydantic then validates each item as int."""
+    if value is None:
+        return None
+    items = [value] if isinstance(value, str) else value
+    ids = [part.strip() for item in items for part in str(item).split(",") if part.strip()]
+    return ids or None
+
+
+# Integer ID lists, parsed and validated by pydantic (422 on malformed input).
+IdList = Annotated[Optional[List[int]], BeforeValidator(_split_ids)]
+BranchIds = Annotated[IdList, Query(description="Comma-separated branch IDs")]
+DepartmentIds = Annotated[IdList, Query(description="Comma-separated department IDs")]
+
+DateRange = Tuple[date, date]
+
+
+def date_range(default_days: int):
+    """Dependency factory: date_from/date_to query params; date_to defaults to today, date_from to default_days before it."""
+    def dependency(date_from: Optional[date] = Query(None), date_to: Optional[date] = Query(None)) -> DateRange:
+        date_to = date_to or date.today()
+        return date_from or date_to - timedelta(days=default_days), date_to
+    return dependency
+
+
+def month_range(year: Optional[int] = Query(None), month: Optional[int] = Query(None, ge=1, le=12)) -> DateRange:
+    """The given calendar month; without year+month, month-to-date (the previous full month on the 1st)."""
+    if year and month:
+        date_from = date(year, month, 1)
+    else:
+        today = date.today()
+        if today.day > 1:
+            return today.replace(day=1), today
+        date_from = (today - timedelta(days=1)).replace(day=1)
+    next_month = (date_from + timedelta(days=32)).replace(day=1)
+    return date_from, next_month - timedelta(days=1)
+
+
+def cached_view(ttl: int = 300):
+    """
+    Add Cache-Control and a content ETag to a view-backed JSON endpoint.
+    Answers 304 Not Modified when the client's If-None-Match already holds the ETag.
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, request: Request, **kwargs):
+            # orjson encodes plain rows natively; jsonable_encoder only sees what it can't (models, Decimal).
+            body = orjson.dumps(await fn(*args, **kwargs), default=jsonable_encoder)
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            headers = {"ETag": etag, "Cache-Control": f"public, max-age={ttl}, stale-while-revalidate=60"}
+            if_none_match = request.headers.get("if-none-match", "")
+            if etag in (t.strip() for t in if_none_match.split(",")):
+                return Response(status_code=304, headers=headers)
+            return Response(content=body, media_type="application/json", headers=headers)
+
+        # Expose the Request to FastAPI's dependency injection without changing the endpoint's own signature.
+        request_param = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        wrapper.__signature__ = sig.replace(parameters=[*sig.parameters.values(), request_param])
+        return wrapper
+    return decorator
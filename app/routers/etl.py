@@ -11,39 +11,49 @@ from sqlalchemy.orm import Session
 
 from app.database import get_db, engine
 from app.config import settings
+from app.services import kpi_views, kpis, predictions, predictive, trends
+
+try:
+    from database import seed_data
+except ImportError:  # repo root not on sys.path; fall back to running the script
+    seed_data = None
 
 router = APIRouter(prefix="/api/etl", tags=["etl"])
 
+# Materialized KPI aggregates defined in schema.sql; each has a unique index for CONCURRENTLY.
+MATERIALIZED_VIEWS = (
+    "mv_kpi_summary_daily",
+    "mv_admissions_daily",
+    "mv_resource_daily",
+    "mv_doctor_slots_daily",
+    "mv_admissions_hourly",
+)
+
+
+def _clear_caches() -> None:
+    """Drop in-process service caches after the data changed."""
+    for service in (kpi_views, kpis, predictions, predictive, trends):
+        service.clear_cache()
+
 
 @router.post("/run-schema")
 def run_schema():
-    """Apply database schema (schema.sql). Uses psql if available, else runs SQL via engine."""
+    """Apply database schema (schema.sql) in one round trip over the sync engine."""
     schema_path = Path(__file__).resolve().parent.parent.parent / "database" / "schema.sql"
     if not schema_path.exists():
         raise HTTPException(status_code=404, detail="database/schema.sql not found")
-    db_url = settings.database_url
-    if db_url.startswith("postgresql://") or db_url.startswith("postgres://"):
-        result = subprocess.run(
-            ["psql", db_url, "-f", str(schema_path)],
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode != 0 and "already exists" not in (result.stderr or ""):
-            raise HTTPException(status_code=500, detail=result.stderr or result.stdout)
-        return {"status": "ok", "message": "Schema applied via psql."}
     with open(schema_path) as f:
         sql = f.read()
     try:
-        with engine.connect() as conn:
-            for stmt in sql.split(";"):
-                s = stmt.strip()
-                if s and not s.startswith("--"):
-                    try:
-                        conn.execute(text(s + ";"))
-                    except Exception as ex:
-                        if "already exists" not in str(ex).lower():
-                            raise
-            conn.commit()
+        # Whole script in one round trip; schema.sql is idempotent (IF NOT EXISTS / OR REPLACE).
+        # Raw DBAPI cursor without parameters, so '%' in the SQL is not treated as a placeholder.
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.execute(sql)
+            raw.commit()
+        finally:
+            raw.close()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     return {"status": "ok", "message": "Schema applied."}
@@ -51,10 +61,22 @@ def run_schema():
 
 @router.post("/seed")
 def seed():
-    """Run seed_data.py to populate sample data."""
+    """Populate sample data via database/seed_data.py (in-process when importable)."""
     seed_path = Path(__file__).resolve().parent.parent.parent / "database" / "seed_data.py"
     if not seed_path.exists():
         raise HTTPException(status_code=404, detail="database/seed_data.py not found")
+    if seed_data is not None:
+        try:
+            # In-process on the pooled sync engine: no interpreter startup or extra connection handshake.
+            raw = engine.raw_connection()
+            try:
+                seed_data.run(raw)
+            finally:
+                raw.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        _clear_caches()
+        return {"status": "ok", "message": "Seed completed."}
     result = subprocess.run(
         [sys.executable, str(seed_path)],
         env={**__import__("os").environ, "DATABASE_URL": settings.database_url},
@@ -64,4 +86,18 @@ def seed():
     )
     if result.returncode != 0:
         raise HTTPException(status_code=500, detail=result.stderr or result.stdout)
+    _clear_caches()
     return {"status": "ok", "message": "Seed completed.", "stdout": result.stdout}
+
+
+@router.post("/refresh-views")
+def refresh_views():
+    """Refresh materialized KPI aggregates without blocking readers (run after ETL loads, e.g. nightly)."""
+    try:
+        with engine.begin() as conn:
+            for view in MATERIALIZED_VIEWS:
+                conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    _clear_caches()
+    return {"status": "ok", "message": "Materialized views refreshed.", "views": list(MATERIALIZED_VIEWS)}
@@ -1,242 +1,283 @@
 """
 Export API: CSV, Excel, PDF reports.
 """
-from datetime import date, timedelta
+import asyncio
+import concurrent.futures
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
 from io import BytesIO
-from typing import Optional
+from typing import Iterator, List, Sequence
 
 from fastapi import APIRouter, Depends, Query
-from fastapi.responses import StreamingResponse, Response
-import pandas as pd
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import xlsxwriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, run_in_session
 from app.services import kpis, trends, predictions
+from app.routers._common import BranchIds, DateRange, DepartmentIds, date_range
+from app.schemas import BranchComparison, DepartmentComparison, KPISummary
 
 router = APIRouter(prefix="/api/exports", tags=["exports"])
 
+# reportlab rendering is CPU-bound: run it in worker processes, off the event loop and the GIL.
+# Created on the first PDF export (see _pdf_pool), so server workers that never render start no processes.
+_PDF_POOL = None
 
-def _parse_filters(branch_ids: Optional[str], department_ids: Optional[str], date_from: Optional[date], date_to: Optional[date]):
-    b_ids = [int(x) for x in branch_ids.split(",")] if branch_ids else None
-    d_ids = [int(x) for x in department_ids.split(",")] if department_ids else None
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=90)
-    return b_ids, d_ids, date_from, date_to
+# CSV header columns, written even when an export has no rows.
+_KPI_COLUMNS = tuple(KPISummary.model_fields)
+_TREND_COLUMNS = ("period", "period_dt", "admissions", "discharges", "avg_los_days", "occupancy_pct")
+_DEPARTMENT_COLUMNS = tuple(DepartmentComparison.model_fields)
+_BRANCH_COLUMNS = tuple(BranchComparison.model_fields)
+
+# Built once per process; only read by the PDF renderers.
+_STYLES = getSampleStyleSheet()
+_KPI_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+    ("FONTSIZE", (0, 0), (-1, -1), 9),
+    ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+    ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+])
+_ALERT_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+    ("FONTSIZE", (0, 0), (-1, -1), 8),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+
+def _csv_stream(rows: List[dict], columns: Sequence[str], chunk_size: int = 500) -> Iterator[bytes]:
+    """Yield CSV in chunks of rows, serialized by Arrow's C++ writer (header on the first chunk; header only when empty)."""
+    if not rows:
+        buf = BytesIO()
+        pacsv.write_csv(pa.table({name: pa.array([], pa.null()) for name in columns}), buf)
+        yield buf.getvalue()
+        return
+    for i in range(0, len(rows), chunk_size):
+        buf = BytesIO()
+        pacsv.write_csv(pa.Table.from_pylist(rows[i:i + chunk_size]), buf, pacsv.WriteOptions(include_header=i == 0))
+        yield buf.getvalue()
+
+
+def _write_sheet(workbook, name: str, rows: List[dict]) -> None:
+    """Write rows to a new worksheet in row order (required by constant_memory mode)."""
+    ws = workbook.add_worksheet(name)
+    if not rows:
+        return
+    header_fmt = workbook.add_format({"bold": True})
+    ws.write_row(0, 0, list(rows[0]), header_fmt)
+    for i, row in enumerate(rows, start=1):
+        ws.write_row(i, 0, list(row.values()))
 
 
 @router.get("/csv/kpi-summary")
-def export_kpi_csv(
-    branch_ids: Optional[str] = Query(None),
-    department_ids: Optional[str] = Query(None),
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
+async def export_kpi_csv(
+    branch_ids: BranchIds = None,
+    department_ids: DepartmentIds = None,
+    dates: DateRange = Depends(date_range(90)),
+    db: AsyncSession = Depends(get_db),
 ):
     """Export KPI summary as CSV."""
-    b_ids, d_ids, df, dt = _parse_filters(branch_ids, department_ids, date_from, date_to)
-    data = kpis.get_kpi_summary(db, branch_ids=b_ids, department_ids=d_ids, date_from=df, date_to=dt)
-    dframe = pd.DataFrame([data])
-    buf = BytesIO()
-    dframe.to_csv(buf, index=False)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=kpi_summary.csv"})
+    date_from, date_to = dates
+    data = await kpis.get_kpi_summary(db, branch_ids=branch_ids, department_ids=department_ids, date_from=date_from, date_to=date_to)
+    return StreamingResponse(_csv_stream([data], _KPI_COLUMNS), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=kpi_summary.csv"})
 
 
 @router.get("/csv/trends")
-def export_trends_csv(
+async def export_trends_csv(
     granularity: str = Query("monthly", enum=["daily", "weekly", "monthly", "quarterly"]),
-    branch_ids: Optional[str] = Query(None),
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
+    branch_ids: BranchIds = None,
+    dates: DateRange = Depends(date_range(365)),
+    db: AsyncSession = Depends(get_db),
 ):
     """Export trend data as CSV."""
-    b_ids = [int(x) for x in branch_ids.split(",")] if branch_ids else None
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=365)
-    data = trends.get_trends(db, granularity=granularity, branch_ids=b_ids, date_from=date_from, date_to=date_to)
-    dframe = pd.DataFrame(data)
-    buf = BytesIO()
-    dframe.to_csv(buf, index=False)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="text/csv", headers={"Content-Disposition": f"attachment; filename=trends_{granularity}.csv"})
+    date_from, date_to = dates
+    data = await trends.get_trends(db, granularity=granularity, branch_ids=branch_ids, date_from=date_from, date_to=date_to)
+    return StreamingResponse(_csv_stream(data, _TREND_COLUMNS), media_type="text/csv", headers={"Content-Disposition": f"attachment; filename=trends_{granularity}.csv"})
 
 
 @router.get("/csv/department-wise")
-def export_department_wise_csv(
-    branch_ids: Optional[str] = Query(None),
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
+async def export_department_wise_csv(
+    branch_ids: BranchIds = None,
+    dates: DateRange = Depends(date_range(365)),
+    db: AsyncSession = Depends(get_db),
 ):
     """Department-wise CSV: admissions, discharges, ALOS, procedure volume, emergency count per department."""
-    b_ids = [int(x) for x in branch_ids.split(",")] if branch_ids else None
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=365)
-    data = trends.get_department_comparison(db, branch_ids=b_ids, date_from=date_from, date_to=date_to)
-    dframe = pd.DataFrame(data)
-    buf = BytesIO()
-    dframe.to_csv(buf, index=False)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=department_wise.csv"})
+    date_from, date_to = dates
+    data = await trends.get_department_comparison(db, branch_ids=branch_ids, date_from=date_from, date_to=date_to)
+    return StreamingResponse(_csv_stream(data, _DEPARTMENT_COLUMNS), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=department_wise.csv"})
 
 
 @router.get("/csv/branch-comparison")
-def export_branch_comparison_csv(
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
+async def export_branch_comparison_csv(
+    dates: DateRange = Depends(date_range(365)),
+    db: AsyncSession = Depends(get_db),
 ):
     """Export branch comparison as CSV."""
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=365)
-    data = trends.get_branch_comparison(db, date_from=date_from, date_to=date_to)
-    dframe = pd.DataFrame(data)
-    buf = BytesIO()
-    dframe.to_csv(buf, index=False)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=branch_comparison.csv"})
+    date_from, date_to = dates
+    data = await trends.get_branch_comparison(db, date_from=date_from, date_to=date_to)
+    return StreamingResponse(_csv_stream(data, _BRANCH_COLUMNS), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=branch_comparison.csv"})
 
 
 @router.get("/excel/monthly-performance")
-def export_monthly_performance_excel(
-    branch_ids: Optional[str] = Query(None),
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
+async def export_monthly_performance_excel(
+    branch_ids: BranchIds = None,
+    dates: DateRange = Depends(date_range(365)),
 ):
     """Export monthly performance (KPIs + trends + branch comparison) as Excel."""
-    b_ids = [int(x) for x in branch_ids.split(",")] if branch_ids else None
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=365)
-    kpi = kpis.get_kpi_summary(db, branch_ids=b_ids, date_from=date_from, date_to=date_to)
-    trend_data = trends.get_trends(db, granularity="monthly", branch_ids=b_ids, date_from=date_from, date_to=date_to)
-    branch_data = trends.get_branch_comparison(db, date_from=date_from, date_to=date_to)
+    date_from, date_to = dates
+    kpi, trend_data, branch_data = await asyncio.gather(
+        run_in_session(kpis.get_kpi_summary, branch_ids=branch_ids, date_from=date_from, date_to=date_to),
+        run_in_session(trends.get_trends, granularity="monthly", branch_ids=branch_ids, date_from=date_from, date_to=date_to),
+        run_in_session(trends.get_branch_comparison, date_from=date_from, date_to=date_to),
+    )
     buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        pd.DataFrame([kpi]).to_excel(writer, sheet_name="KPI Summary", index=False)
-        pd.DataFrame(trend_data).to_excel(writer, sheet_name="Monthly Trends", index=False)
-        pd.DataFrame(branch_data).to_excel(writer, sheet_name="Branch Comparison", index=False)
-    buf.seek(0)
-    return StreamingResponse(
-        buf,
+    with xlsxwriter.Workbook(buf, {"constant_memory": True}) as workbook:
+        _write_sheet(workbook, "KPI Summary", [kpi])
+        _write_sheet(workbook, "Monthly Trends", trend_data)
+        _write_sheet(workbook, "Branch Comparison", branch_data)
+    # Already complete in memory: send it as one body. getvalue() shares BytesIO's buffer (no copy),
+    # whereas streaming a BytesIO iterates it line by line through the threadpool.
+    return Response(
+        content=buf.getvalue(),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": "attachment; filename=monthly_performance.xlsx"},
     )
 
 
-@router.get("/pdf/kpi-snapshot")
-def export_kpi_snapshot_pdf(
-    branch_ids: Optional[str] = Query(None),
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
-):
-    """KPI snapshot PDF: key metrics and outcome distribution for leadership."""
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-
-    b_ids = [int(x) for x in branch_ids.split(",")] if branch_ids else None
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=30)
-    kpi = kpis.get_kpi_summary(db, branch_ids=b_ids, date_from=date_from, date_to=date_to)
+def _render_kpi_snapshot_pdf(kpi: dict, date_from: date, date_to: date) -> bytes:
     buf = BytesIO()
     doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
-    styles = getSampleStyleSheet()
     story = []
-    story.append(Paragraph("Hospital Resource Utilization & Patient Outcomes — KPI Snapshot", styles["Title"]))
+    story.append(Paragraph("Hospital Resource Utilization & Patient Outcomes — KPI Snapshot", _STYLES["Title"]))
     story.append(Spacer(1, 0.2 * inch))
-    story.append(Paragraph(f"Period: {date_from} to {date_to}", styles["Heading2"]))
+    story.append(Paragraph(f"Period: {date_from} to {date_to}", _STYLES["Heading2"]))
     story.append(Spacer(1, 0.3 * inch))
-    story.append(Paragraph("Key Performance Indicators", styles["Heading3"]))
+    story.append(Paragraph("Key Performance Indicators", _STYLES["Heading3"]))
     kpi_rows = [["Metric", "Value"]] + [[k.replace("_", " ").title(), str(v)] for k, v in kpi.items()]
     t = Table(kpi_rows, colWidths=[3 * inch, 2 * inch])
-    t.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("FONTSIZE", (0, 0), (-1, -1), 9),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-        ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-    ]))
+    t.setStyle(_KPI_TABLE_STYLE)
     story.append(t)
     doc.build(story)
-    buf.seek(0)
-    return Response(content=buf.getvalue(), media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=kpi_snapshot.pdf"})
+    return buf.getvalue()
 
 
-@router.get("/pdf/monthly-summary")
-def export_monthly_summary_pdf(
-    branch_ids: Optional[str] = Query(None),
-    date_from: Optional[date] = Query(None),
-    date_to: Optional[date] = Query(None),
-    db: Session = Depends(get_db),
-):
-    """Generate monthly performance summary as PDF (using reportlab)."""
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-
-    b_ids = [int(x) for x in branch_ids.split(",")] if branch_ids else None
-    if not date_to:
-        date_to = date.today()
-    if not date_from:
-        date_from = date_to - timedelta(days=30)
-    kpi = kpis.get_kpi_summary(db, branch_ids=b_ids, date_from=date_from, date_to=date_to)
-    alerts = predictions.get_resource_alerts(db, branch_ids=b_ids)
-
+def _render_monthly_summary_pdf(kpi: dict, alerts: List[dict], date_from: date, date_to: date) -> bytes:
     buf = BytesIO()
     doc = SimpleDocTemplate(buf, pagesize=A4, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
-    styles = getSampleStyleSheet()
     story = []
-    story.append(Paragraph("Hospital Resource Utilization & Patient Outcomes", styles["Title"]))
+    story.append(Paragraph("Hospital Resource Utilization & Patient Outcomes", _STYLES["Title"]))
     story.append(Spacer(1, 0.2 * inch))
-    story.append(Paragraph(f"Monthly Performance Summary: {date_from} to {date_to}", styles["Heading2"]))
+    story.append(Paragraph(f"Monthly Performance Summary: {date_from} to {date_to}", _STYLES["Heading2"]))
     story.append(Spacer(1, 0.3 * inch))
-    story.append(Paragraph("Key Performance Indicators", styles["Heading3"]))
+    story.append(Paragraph("Key Performance Indicators", _STYLES["Heading3"]))
     kpi_rows = [["Metric", "Value"]] + [[k, str(v)] for k, v in kpi.items()]
     t = Table(kpi_rows, colWidths=[3 * inch, 2 * inch])
-    t.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("FONTSIZE", (0, 0), (-1, -1), 9),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-        ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-    ]))
+    t.setStyle(_KPI_TABLE_STYLE)
     story.append(t)
     story.append(Spacer(1, 0.3 * inch))
     if alerts:
-        story.append(Paragraph("Resource Alerts", styles["Heading3"]))
+        story.append(Paragraph("Resource Alerts", _STYLES["Heading3"]))
         alert_rows = [["Type", "Severity", "Message"]] + [[a.get("alert_type", ""), a.get("severity", ""), a.get("message", "")[:80]] for a in alerts[:10]]
         t2 = Table(alert_rows, colWidths=[1.5 * inch, 0.8 * inch, 3.2 * inch])
-        t2.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-            ("FONTSIZE", (0, 0), (-1, -1), 8),
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-        ]))
+        t2.setStyle(_ALERT_TABLE_STYLE)
         story.append(t2)
     doc.build(story)
-    buf.seek(0)
-    return Response(content=buf.getvalue(), media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=monthly_summary.pdf"})
+    return buf.getvalue()
+
+
+def _pdf_pool() -> ProcessPoolExecutor:
+    """The PDF process pool, created on first use. "spawn": workers never inherit the server's threads, locks or DB connections."""
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        _PDF_POOL = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+    return _PDF_POOL
+
+
+def _reset_pdf_pool(broken: ProcessPoolExecutor) -> None:
+    """
+    Discard a broken pool (a worker died); the next export starts a fresh one. Only the pool that
+    failed is shut down, so a concurrent request that already replaced it keeps its retry.
+    """
+    global _PDF_POOL
+    if _PDF_POOL is broken:
+        _PDF_POOL = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_in_pdf_pool(render, *args) -> bytes:
+    """Submit one render; on BrokenProcessPool the failed pool is reset before re-raising."""
+    pool = _pdf_pool()
+    future = pool.submit(render, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        _reset_pdf_pool(pool)
+        raise
+    except asyncio.CancelledError:
+        # Cancelled by a pool shutdown (not by the client going away): report it as a failed render
+        if future.cancelled():
+            raise concurrent.futures.CancelledError("PDF render was cancelled") from None
+        raise
+
+
+async def _render_pdf(filename: str, render, *args) -> Response:
+    """
+    Render in the PDF process pool and return the file in this response, so it works under any
+    number of server workers. A broken pool is replaced and the render retried once; a render
+    that fails or is cancelled answers 500 with a JSON {"status": "failed"} body.
+    """
+    try:
+        try:
+            content = await _run_in_pdf_pool(render, *args)
+        except BrokenProcessPool:
+            content = await _run_in_pdf_pool(render, *args)
+    except BrokenProcessPool:
+        return ORJSONResponse({"status": "failed", "detail": "PDF worker process died"}, status_code=500)
+    except concurrent.futures.CancelledError:
+        return ORJSONResponse({"status": "failed", "detail": "PDF render was cancelled"}, status_code=500)
+    except Exception as e:
+        return ORJSONResponse({"status": "failed", "detail": str(e)}, status_code=500)
+    return Response(content=content, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
+@router.get("/pdf/kpi-snapshot")
+async def export_kpi_snapshot_pdf(
+    branch_ids: BranchIds = None,
+    dates: DateRange = Depends(date_range(30)),
+    db: AsyncSession = Depends(get_db),
+):
+    """KPI snapshot PDF: key metrics and outcome distribution for leadership."""
+
+    date_from, date_to = dates
+    kpi = await kpis.get_kpi_summary(db, branch_ids=branch_ids, date_from=date_from, date_to=date_to)
+    return await _render_pdf("kpi_snapshot.pdf", _render_kpi_snapshot_pdf, kpi, date_from, date_to)
+
+
+@router.get("/pdf/monthly-summary")
+async def export_monthly_summary_pdf(
+    branch_ids: BranchIds = None,
+    dates: DateRange = Depends(date_range(30)),
+):
+    """Generate monthly performance summary as PDF (using reportlab)."""
+
+    date_from, date_to = dates
+    kpi, alerts = await asyncio.gather(
+        run_in_session(kpis.get_kpi_summary, branch_ids=branch_ids, date_from=date_from, date_to=date_to),
+        run_in_session(predictions.get_resource_alerts, branch_ids=branch_ids),
+    )
+    return await _render_pdf("monthly_summary.pdf", _render_monthly_summary_pdf, kpi, alerts, date_from, date_to)
+
@@ -70,6 +70,33 @@ class Alert(BaseModel):
     period_end: Optional[date] = None
 
 
+class Bottleneck(BaseModel):
+    flag_type: str  # delayed_discharge, peak_hour_surplus
+    root_cause: str
+    branch_id: Optional[int] = None
+    branch_name: Optional[str] = None
+    department_id: Optional[int] = None
+    department_name: Optional[str] = None
+    count: Optional[int] = None
+    avg_los_days: Optional[float] = None
+    hour: Optional[int] = None
+    admissions_count: Optional[int] = None
+
+
+class Period(BaseModel):
+    date_from: date
+    date_to: date
+
+
+class MonthlySummary(BaseModel):
+    period: Period
+    kpis: KPISummary
+    monthly_trends: List[dict]
+    branch_comparison: List[BranchComparison]
+    alerts: List[Alert] = []
+    bottlenecks: List[Bottleneck] = []
+
+
 class ExportRequest(BaseModel):
     format: str  # csv, excel, pdf
     report_type: str  # kpi_summary, monthly_performance, trends, branch_comparison
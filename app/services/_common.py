@@ -0,0 +1,77 @@
+"""
+Shared SQL and result-cache helpers for the service modules.
+"""
+import copy
+import functools
+import inspect
+from typing import List, Optional
+
+from cachetools import TTLCache
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
+
+from app.config import settings
+
+# ID-list filters, written as "col IN :name" and bound as expanding parameters.
+ID_LIST_PARAMS = ("branch_ids", "department_ids")
+
+
+def id_list(ids: Optional[List[int]]) -> Optional[List[int]]:
+    """
+    Pad an ID list to the next power-of-two length by repeating its last ID.
+    The expanded IN (...) then takes one of a few shapes, so prepared plans are reused.
+    """
+    if not ids:
+        return ids
+    size = 1
+    while size < len(ids):
+        size *= 2
+    return list(ids) + [ids[-1]] * (size - len(ids))
+
+
+def sql(q: str) -> TextClause:
+    """text() with the ID-list parameters it references bound as expanding (IN) parameters."""
+    stmt = text(q)
+    expanding = [bindparam(name, expanding=True) for name in ID_LIST_PARAMS if f":{name}" in q]
+    return stmt.bindparams(*expanding) if expanding else stmt
+
+
+async def set_local_work_mem(db: AsyncSession) -> None:
+    """
+    Raise work_mem for the rest of the session's transaction so large aggregations stay in memory (HashAgg).
+    set_config(..., true) is SET LOCAL: it reverts when the transaction ends, before the connection is pooled again.
+    """
+    await db.execute(text("SELECT set_config('work_mem', :work_mem, true)"), {"work_mem": settings.db_work_mem})
+
+
+_MISSING = object()
+
+
+def cached(cache: TTLCache):
+    """
+    Serve repeat calls of an async service function from cache, keyed on the function name and its
+    arguments other than db (lists become tuples). Each module owns its cache and clears it in clear_cache().
+    Callers get a deep copy, so mutating a result never changes the cached value.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(db, *args, **kwargs):
+            bound = signature.bind(db, *args, **kwargs)
+            bound.apply_defaults()
+            key = (fn.__name__,) + tuple(
+                tuple(value) if isinstance(value, list) else value
+                for name, value in bound.arguments.items()
+                if name != "db"
+            )
+            result = cache.get(key, _MISSING)
+            if result is _MISSING:
+                result = await fn(db, *args, **kwargs)
+                cache[key] = result
+            return copy.deepcopy(result)
+
+        return wrapper
+
+    return decorator
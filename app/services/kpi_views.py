@@ -2,14 +2,137 @@
 KPI data from validated SQL views (v_kpi_*). Used by API and Superset.
 """
 from datetime import date, timedelta
-from typing import Optional, List
+from functools import lru_cache
+from typing import Dict, Optional, List
 
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
+from app.services._common import cached, id_list, sql
 
-def get_alos_from_view(
-    db: Session,
+# View results change at most daily (ETL/seed); cleared by clear_cache() after a seed.
+_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+def clear_cache() -> None:
+    """Drop all cached view results (call after data changes)."""
+    _cache.clear()
+
+
+def _filters(**values) -> dict:
+    """Bind params for the filters that were given; their names double as the statement shape."""
+    return {name: value for name, value in values.items() if value}
+
+
+def _where(params: dict, predicates: dict) -> str:
+    """WHERE clause AND-ing the predicate of each filter present in params."""
+    preds = [predicates[name] for name in params]
+    return " WHERE " + " AND ".join(preds) if preds else ""
+
+
+def _statement(q: str) -> TextClause:
+    return sql(q).execution_options(yield_per=1000)
+
+
+async def _fetch_dicts(db: AsyncSession, stmt: TextClause, params: Optional[dict] = None) -> List[dict]:
+    """
+    Rows as plain dicts, read from a server-side cursor 1000 at a time.
+    Queries do their own NULL/numeric/date coercion in SQL, so rows need no per-column Python work.
+    """
+    result = await db.stream(stmt, params or {})
+    return [dict(m) async for m in result.mappings()]
+
+
+def to_columns(rows: List[dict]) -> Dict[str, list]:
+    """Columnar layout of view rows: each column name once, with its values as a parallel list."""
+    if not rows:
+        return {}
+    return {key: [row[key] for row in rows] for key in rows[0]}
+
+
+# Statements are built once per filter shape (which optional filters are present) and reused,
+# so repeat calls skip SQL assembly and hit SQLAlchemy's compiled cache and asyncpg's
+# per-connection prepared statements.
+
+@lru_cache(maxsize=None)
+def _alos_statement(shape: tuple, group_by: str) -> TextClause:
+    period_col = "period_month" if group_by == "month" else "period_date"
+    clause = _where(dict.fromkeys(shape), {
+        "date_from": "period_date >= :date_from",
+        "date_to": "period_date <= :date_to",
+        "branch_ids": "branch_id IN :branch_ids",
+        "department_ids": "department_id IN :department_ids",
+    })
+    return _statement(f"""
+    SELECT branch_name, department_name, to_char({period_col}, 'YYYY-MM-DD') AS period,
+           discharge_count, COALESCE(alos_days, 0)::float8 AS alos_days
+    FROM v_kpi_alos
+    {clause}
+    ORDER BY {period_col}
+    """)
+
+
+@lru_cache(maxsize=None)
+def _bed_occupancy_statement(shape: tuple) -> TextClause:
+    clause = _where(dict.fromkeys(shape), {
+        "date_from": "record_date >= :date_from",
+        "date_to": "record_date <= :date_to",
+        "branch_ids": "branch_id IN :branch_ids",
+    })
+    return _statement(f"""
+    SELECT branch_name, to_char(record_date, 'YYYY-MM-DD') AS record_date, record_hour,
+           beds_occupied, total_beds, COALESCE(occupancy_pct, 0)::float8 AS occupancy_pct
+    FROM v_kpi_bed_occupancy
+    {clause}
+    ORDER BY v_kpi_bed_occupancy.record_date, record_hour
+    """)
+
+
+_EXECUTIVE_SNAPSHOT = _statement("""
+    SELECT to_char(period_month, 'YYYY-MM-DD') AS period_month, total_admissions, total_discharges,
+           COALESCE(alos_days, 0)::float8 AS alos_days, emergency_count, scheduled_count
+    FROM v_kpi_executive_snapshot
+    """)
+
+
+@lru_cache(maxsize=None)
+def _outcome_distribution_statement(shape: tuple) -> TextClause:
+    clause = _where(dict.fromkeys(shape), {
+        "date_from": "period_month >= :date_from",
+        "date_to": "period_month <= :date_to",
+        "branch_ids": "branch_id IN :branch_ids",
+    })
+    return _statement(f"""
+    SELECT branch_name, department_name, to_char(period_month, 'YYYY-MM-DD') AS period_month,
+           outcome_code, outcome_name, outcome_count
+    FROM v_kpi_outcome_distribution
+    {clause}
+    ORDER BY v_kpi_outcome_distribution.period_month, outcome_count DESC
+    """)
+
+
+@lru_cache(maxsize=None)
+def _icu_utilization_statement(shape: tuple) -> TextClause:
+    clause = _where(dict.fromkeys(shape), {
+        "date_from": "record_date >= :date_from",
+        "date_to": "record_date <= :date_to",
+        "branch_ids": "branch_id IN :branch_ids",
+    })
+    return _statement(f"""
+    SELECT branch_name, to_char(record_date, 'YYYY-MM-DD') AS record_date, record_hour,
+           icu_occupied, icu_beds, ventilators_used, ventilator_count,
+           COALESCE(icu_occupancy_pct, 0)::float8 AS icu_occupancy_pct,
+           COALESCE(ventilator_utilization_pct, 0)::float8 AS ventilator_utilization_pct
+    FROM v_kpi_icu_utilization
+    {clause}
+    ORDER BY v_kpi_icu_utilization.record_date, record_hour
+    """)
+
+
+@cached(_cache)
+async def get_alos_from_view(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     department_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
@@ -17,107 +140,47 @@ def get_alos_from_view(
     group_by: str = "month",
 ) -> List[dict]:
     """Average Length of Stay from v_kpi_alos."""
-    params = {}
-    clause = " WHERE 1=1"
-    if date_from:
-        clause += " AND period_date >= :date_from"
-        params["date_from"] = date_from
-    if date_to:
-        clause += " AND period_date <= :date_to"
-        params["date_to"] = date_to
-    if branch_ids:
-        clause += " AND branch_id = ANY(:branch_ids)"
-        params["branch_ids"] = branch_ids
-    if department_ids:
-        clause += " AND department_id = ANY(:department_ids)"
-        params["department_ids"] = department_ids
-    period_col = "period_month" if group_by == "month" else "period_date"
-    q = f"""
-    SELECT branch_name, department_name, {period_col} AS period,
-           discharge_count, alos_days
-    FROM v_kpi_alos
-    {clause}
-    ORDER BY {period_col}
-    """
-    rows = db.execute(text(q), params).fetchall()
-    return [{"branch_name": r.branch_name, "department_name": r.department_name, "period": str(r.period), "discharge_count": r.discharge_count, "alos_days": float(r.alos_days or 0)} for r in rows]
+    params = _filters(date_from=date_from, date_to=date_to, branch_ids=id_list(branch_ids), department_ids=id_list(department_ids))
+    return await _fetch_dicts(db, _alos_statement(tuple(params), group_by), params)
 
 
-def get_bed_occupancy_from_view(
-    db: Session,
+@cached(_cache)
+async def get_bed_occupancy_from_view(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
 ) -> List[dict]:
     """Bed occupancy from v_kpi_bed_occupancy."""
-    params = {}
-    clause = " WHERE 1=1"
-    if date_from:
-        clause += " AND record_date >= :date_from"
-        params["date_from"] = date_from
-    if date_to:
-        clause += " AND record_date <= :date_to"
-        params["date_to"] = date_to
-    if branch_ids:
-        clause += " AND branch_id = ANY(:branch_ids)"
-        params["branch_ids"] = branch_ids
-    q = f"""
-    SELECT branch_name, record_date, record_hour, beds_occupied, total_beds, occupancy_pct
-    FROM v_kpi_bed_occupancy
-    {clause}
-    ORDER BY record_date, record_hour
-    """
-    rows = db.execute(text(q), params).fetchall()
-    return [{"branch_name": r.branch_name, "record_date": str(r.record_date), "record_hour": r.record_hour, "beds_occupied": r.beds_occupied, "total_beds": r.total_beds, "occupancy_pct": float(r.occupancy_pct or 0)} for r in rows]
+    params = _filters(date_from=date_from, date_to=date_to, branch_ids=id_list(branch_ids))
+    return await _fetch_dicts(db, _bed_occupancy_statement(tuple(params)), params)
 
 
-def get_executive_snapshot_from_view(db: Session) -> List[dict]:
+@cached(_cache)
+async def get_executive_snapshot_from_view(db: AsyncSession) -> List[dict]:
     """Executive KPI snapshot from v_kpi_executive_snapshot."""
-    rows = db.execute(text("SELECT * FROM v_kpi_executive_snapshot")).fetchall()
-    return [{"period_month": str(r.period_month), "total_admissions": r.total_admissions, "total_discharges": r.total_discharges, "alos_days": float(r.alos_days or 0), "emergency_count": r.emergency_count, "scheduled_count": r.scheduled_count} for r in rows]
+    return await _fetch_dicts(db, _EXECUTIVE_SNAPSHOT)
 
 
-def get_outcome_distribution_from_view(
-    db: Session,
+@cached(_cache)
+async def get_outcome_distribution_from_view(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
 ) -> List[dict]:
     """Outcome distribution from v_kpi_outcome_distribution."""
-    params = {}
-    clause = " WHERE 1=1"
-    if date_from:
-        clause += " AND period_month >= :date_from"
-        params["date_from"] = date_from
-    if date_to:
-        clause += " AND period_month <= :date_to"
-        params["date_to"] = date_to
-    if branch_ids:
-        clause += " AND branch_id = ANY(:branch_ids)"
-        params["branch_ids"] = branch_ids
-    q = f"SELECT branch_name, department_name, period_month, outcome_code, outcome_name, outcome_count FROM v_kpi_outcome_distribution {clause} ORDER BY period_month, outcome_count DESC"
-    rows = db.execute(text(q), params).fetchall()
-    return [{"branch_name": r.branch_name, "department_name": r.department_name, "period_month": str(r.period_month), "outcome_code": r.outcome_code, "outcome_name": r.outcome_name, "outcome_count": r.outcome_count} for r in rows]
-
-
-def get_icu_utilization_from_view(
-    db: Session,
+    params = _filters(date_from=date_from, date_to=date_to, branch_ids=id_list(branch_ids))
+    return await _fetch_dicts(db, _outcome_distribution_statement(tuple(params)), params)
+
+
+@cached(_cache)
+async def get_icu_utilization_from_view(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
 ) -> List[dict]:
     """ICU & ventilator utilization from v_kpi_icu_utilization."""
-    params = {}
-    clause = " WHERE 1=1"
-    if date_from:
-        clause += " AND record_date >= :date_from"
-        params["date_from"] = date_from
-    if date_to:
-        clause += " AND record_date <= :date_to"
-        params["date_to"] = date_to
-    if branch_ids:
-        clause += " AND branch_id = ANY(:branch_ids)"
-        params["branch_ids"] = branch_ids
-    q = f"SELECT branch_name, record_date, record_hour, icu_occupied, icu_beds, ventilators_used, ventilator_count, icu_occupancy_pct, ventilator_utilization_pct FROM v_kpi_icu_utilization {clause} ORDER BY record_date, record_hour"
-    rows = db.execute(text(q), params).fetchall()
-    return [{"branch_name": r.branch_name, "record_date": str(r.record_date), "record_hour": r.record_hour, "icu_occupied": r.icu_occupied, "icu_beds": r.icu_beds, "ventilators_used": r.ventilators_used, "ventilator_count": r.ventilator_count, "icu_occupancy_pct": float(r.icu_occupancy_pct or 0), "ventilator_utilization_pct": float(r.ventilator_utilization_pct or 0)} for r in rows]
+    params = _filters(date_from=date_from, date_to=date_to, branch_ids=id_list(branch_ids))
+    return await _fetch_dicts(db, _icu_utilization_statement(tuple(params)), params)
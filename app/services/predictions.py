@@ -4,12 +4,23 @@ Predictive alerts for resource shortages and bottleneck identification.
 from datetime import date, timedelta
 from typing import Optional, List
 
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.services._common import cached, id_list, sql
 
-def get_resource_alerts(
-    db: Session,
+# Alert panels re-poll with the same thresholds; results are reused for a minute.
+_cache = TTLCache(maxsize=512, ttl=60)
+
+
+def clear_cache() -> None:
+    """Drop cached resource alerts (call after data changes)."""
+    _cache.clear()
+
+
+@cached(_cache)
+async def get_resource_alerts(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     days_ahead: int = 7,
     occupancy_threshold_pct: float = 85,
@@ -19,74 +30,79 @@ def get_resource_alerts(
     Predict upcoming resource needs (ICU beds, ventilators) and flag high occupancy.
     Uses recent resource_allocation and admission trends.
     """
+    today = date.today()
+    period_end = today + timedelta(days=days_ahead)
     params = {
-        "date_from": date.today() - timedelta(days=14),
-        "date_to": date.today(),
+        "date_from": today - timedelta(days=14),
+        "date_to": today,
         "occupancy_threshold": occupancy_threshold_pct,
         "utilization_threshold": utilization_threshold_pct,
     }
-    branch_clause = " AND ra.branch_id = ANY(:branch_ids)" if branch_ids else ""
+    branch_clause = " AND ra.branch_id IN :branch_ids" if branch_ids else ""
     if branch_ids:
-        params["branch_ids"] = branch_ids
+        params["branch_ids"] = id_list(branch_ids)
 
     alerts = []
 
-    # Current bed occupancy by branch (from resource_allocation)
+    # Current occupancy by branch (from resource_allocation); HAVING returns only branches
+    # over at least one threshold, the loop below picks which alert(s) each one raises.
     occ_q = f"""
-    SELECT ra.branch_id, b.name, b.bed_count, b.icu_beds, b.ventilator_count,
-           AVG(ra.beds_occupied) AS avg_beds_occ,
-           AVG(ra.icu_occupied) AS avg_icu_occ,
-           AVG(ra.ventilators_used) AS avg_vent_used,
-           AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) AS bed_occ_pct,
-           AVG(ra.icu_occupied * 100.0 / NULLIF(b.icu_beds, 0)) AS icu_occ_pct,
-           AVG(ra.ventilators_used * 100.0 / NULLIF(b.ventilator_count, 0)) AS vent_occ_pct
+    SELECT ra.branch_id, b.name,
+           AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0))::float8 AS bed_occ_pct,
+           AVG(ra.icu_occupied * 100.0 / NULLIF(b.icu_beds, 0))::float8 AS icu_occ_pct,
+           AVG(ra.ventilators_used * 100.0 / NULLIF(b.ventilator_count, 0))::float8 AS vent_occ_pct
     FROM resource_allocation ra
     JOIN hospital_branches b ON b.branch_id = ra.branch_id
     WHERE ra.record_date >= :date_from AND ra.record_date <= :date_to
     {branch_clause}
-    GROUP BY ra.branch_id, b.name, b.bed_count, b.icu_beds, b.ventilator_count
+    GROUP BY ra.branch_id, b.name
+    HAVING AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) >= CAST(:occupancy_threshold AS float8)
+        OR AVG(ra.icu_occupied * 100.0 / NULLIF(b.icu_beds, 0)) >= CAST(:utilization_threshold AS float8)
+        OR AVG(ra.ventilators_used * 100.0 / NULLIF(b.ventilator_count, 0)) >= CAST(:utilization_threshold AS float8)
     """
-    rows = db.execute(text(occ_q), params).fetchall()
+    rows = (await db.execute(sql(occ_q), params)).fetchall()
+    # Percentages arrive as float8 (no Decimal conversion); each is read once per row.
     for r in rows:
-        if r.bed_occ_pct and float(r.bed_occ_pct) >= occupancy_threshold_pct:
+        bed_pct, icu_pct, vent_pct = r.bed_occ_pct, r.icu_occ_pct, r.vent_occ_pct
+        if bed_pct and bed_pct >= occupancy_threshold_pct:
             alerts.append({
                 "alert_type": "high_bed_occupancy",
-                "severity": "warning" if float(r.bed_occ_pct) < 95 else "critical",
-                "message": f"Bed occupancy at {r.name} is {float(r.bed_occ_pct):.1f}% (threshold {occupancy_threshold_pct}%). Consider capacity or discharge planning.",
+                "severity": "warning" if bed_pct < 95 else "critical",
+                "message": f"Bed occupancy at {r.name} is {bed_pct:.1f}% (threshold {occupancy_threshold_pct}%). Consider capacity or discharge planning.",
                 "branch_id": r.branch_id,
                 "department_id": None,
                 "predicted_shortage": "general beds",
-                "period_start": date.today(),
-                "period_end": date.today() + timedelta(days=days_ahead),
+                "period_start": today,
+                "period_end": period_end,
             })
-        if r.icu_occ_pct and float(r.icu_occ_pct) >= utilization_threshold_pct:
+        if icu_pct and icu_pct >= utilization_threshold_pct:
             alerts.append({
                 "alert_type": "icu_shortage_risk",
                 "severity": "warning",
-                "message": f"ICU utilization at {r.name} is {float(r.icu_occ_pct):.1f}%. Risk of shortage in next {days_ahead} days.",
+                "message": f"ICU utilization at {r.name} is {icu_pct:.1f}%. Risk of shortage in next {days_ahead} days.",
                 "branch_id": r.branch_id,
                 "department_id": None,
                 "predicted_shortage": "ICU beds",
-                "period_start": date.today(),
-                "period_end": date.today() + timedelta(days=days_ahead),
+                "period_start": today,
+                "period_end": period_end,
             })
-        if r.vent_occ_pct and float(r.vent_occ_pct) >= utilization_threshold_pct:
+        if vent_pct and vent_pct >= utilization_threshold_pct:
             alerts.append({
                 "alert_type": "ventilator_shortage_risk",
                 "severity": "warning",
-                "message": f"Ventilator utilization at {r.name} is {float(r.vent_occ_pct):.1f}%. Consider backup capacity.",
+                "message": f"Ventilator utilization at {r.name} is {vent_pct:.1f}%. Consider backup capacity.",
                 "branch_id": r.branch_id,
                 "department_id": None,
                 "predicted_shortage": "ventilators",
-                "period_start": date.today(),
-                "period_end": date.today() + timedelta(days=days_ahead),
+                "period_start": today,
+                "period_end": period_end,
             })
 
     return alerts
 
 
-def get_bottlenecks(
-    db: Session,
+async def get_bottlenecks(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
@@ -99,30 +115,31 @@ def get_bottlenecks(
     if not date_to:
         date_to = date.today()
     params = {"date_from": date_from, "date_to": date_to}
-    branch_clause = " AND a.branch_id = ANY(:branch_ids)" if branch_ids else ""
+    branch_clause = " AND m.branch_id IN :branch_ids" if branch_ids else ""
     if branch_ids:
-        params["branch_ids"] = branch_ids
+        params["branch_ids"] = id_list(branch_ids)
 
     bottlenecks = []
 
+    # Both flags read the hourly admission roll-up in mv_admissions_hourly (refreshed after ETL)
+    # rather than scanning admissions/discharges per request.
+
     # Discharge turnaround: admissions that stayed longer than 14 days (flag as potential delayed discharge)
     delay_q = f"""
-    SELECT a.branch_id, b.name AS branch_name, a.department_id, dp.name AS dept_name,
-           COUNT(*) AS long_stay_count,
-           AVG(EXTRACT(EPOCH FROM (dis.discharge_at - a.admission_at))/86400) AS avg_los
-    FROM admissions a
-    JOIN discharges dis ON dis.admission_id = a.admission_id
-    JOIN hospital_branches b ON b.branch_id = a.branch_id
-    JOIN departments dp ON dp.department_id = a.department_id
-    WHERE a.admission_at >= :date_from AND a.admission_at < :date_to + interval '1 day'
-    AND EXTRACT(EPOCH FROM (dis.discharge_at - a.admission_at))/86400 > 14
+    SELECT m.branch_id, b.name AS branch_name, m.department_id, dp.name AS dept_name,
+           SUM(m.long_stays)::bigint AS long_stay_count,
+           SUM(m.long_stay_days_sum) / NULLIF(SUM(m.long_stays), 0) AS avg_los
+    FROM mv_admissions_hourly m
+    JOIN hospital_branches b ON b.branch_id = m.branch_id
+    JOIN departments dp ON dp.department_id = m.department_id
+    WHERE m.dt >= :date_from AND m.dt <= :date_to
     {branch_clause}
-    GROUP BY a.branch_id, b.name, a.department_id, dp.name
-    HAVING COUNT(*) >= 5
+    GROUP BY m.branch_id, b.name, m.department_id, dp.name
+    HAVING SUM(m.long_stays) >= 5
     ORDER BY long_stay_count DESC
     """
     try:
-        for r in db.execute(text(delay_q), params).fetchall():
+        for r in (await db.execute(sql(delay_q), params)).fetchall():
             bottlenecks.append({
                 "flag_type": "delayed_discharge",
                 "root_cause": "High proportion of long-stay (>14 days) patients.",
@@ -139,21 +156,21 @@ def get_bottlenecks(
     # Peak hour surplus: hours with admission count > 2x daily average
     peak_q = f"""
     WITH hourly AS (
-        SELECT EXTRACT(HOUR FROM a.admission_at)::int AS hour,
-               COUNT(*) AS cnt
-        FROM admissions a
-        WHERE a.admission_at >= :date_from AND a.admission_at < :date_to + interval '1 day'
+        SELECT m.hour, SUM(m.admissions)::bigint AS cnt
+        FROM mv_admissions_hourly m
+        WHERE m.dt >= :date_from AND m.dt <= :date_to
         {branch_clause}
-        GROUP BY 1
+        GROUP BY m.hour
     ),
     avg_daily AS (SELECT SUM(cnt) / 24.0 AS avg_per_hour FROM hourly)
-    SELECT h.hour, h.cnt, (SELECT avg_per_hour FROM avg_daily) AS avg_hr
+    SELECT h.hour, h.cnt, ad.avg_per_hour AS avg_hr
     FROM hourly h
-    WHERE h.cnt > 2 * (SELECT avg_per_hour FROM avg_daily)
+    CROSS JOIN avg_daily ad
+    WHERE h.cnt > 2 * ad.avg_per_hour
     ORDER BY h.cnt DESC
     """
     try:
-        for r in db.execute(text(peak_q), params).fetchall():
+        for r in (await db.execute(sql(peak_q), params)).fetchall():
             bottlenecks.append({
                 "flag_type": "peak_hour_surplus",
                 "root_cause": f"Hour {int(r.hour)} has {r.cnt} admissions (2x average). Consider staffing.",
@@ -5,12 +5,22 @@ No complex ML; simple and interpretable.
 from datetime import date, timedelta
 from typing import Optional, List
 
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.services._common import cached, id_list, sql
 
-def get_admission_trend_with_moving_avg(
-    db: Session,
+# Threshold alerts are recomputed at most once a minute per filter set.
+_cache = TTLCache(maxsize=512, ttl=60)
+
+
+def clear_cache() -> None:
+    """Drop cached threshold alerts (call after data changes)."""
+    _cache.clear()
+
+
+async def get_admission_trend_with_moving_avg(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     days: int = 90,
     window_days: int = 7,
@@ -19,34 +29,37 @@ def get_admission_trend_with_moving_avg(
     Daily admission count with N-day moving average for trend visualization.
     Forecast: simple linear extrapolation of last window_days moving average.
     """
-    params = {"days": days, "window_days": window_days}
-    branch_clause = " AND a.branch_id = ANY(:branch_ids)" if branch_ids else ""
+    # Frame covers the current day plus window_days - 1 preceding days
+    params = {"days": days, "window_preceding": window_days - 1}
+    branch_clause = " AND m.branch_id IN :branch_ids" if branch_ids else ""
     if branch_ids:
-        params["branch_ids"] = branch_ids
+        params["branch_ids"] = id_list(branch_ids)
+    # Per-day counts come from mv_admissions_daily (one row per branch/day), not the admissions table.
     q = f"""
     WITH daily AS (
-        SELECT date_trunc('day', a.admission_at)::date AS dt,
-               COUNT(*) AS admissions
-        FROM admissions a
-        WHERE a.admission_at >= CURRENT_DATE - :days
+        SELECT m.dt, SUM(m.admissions)::bigint AS admissions
+        FROM mv_admissions_daily m
+        WHERE m.dt >= CURRENT_DATE - CAST(:days AS int)
         {branch_clause}
-        GROUP BY 1
+        GROUP BY m.dt
     ),
     with_ma AS (
         SELECT dt, admissions,
-               AVG(admissions) OVER (ORDER BY dt ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS moving_avg
+               AVG(admissions) OVER (ORDER BY dt ROWS BETWEEN CAST(:window_preceding AS int) PRECEDING AND CURRENT ROW) AS moving_avg
         FROM daily
     )
-    SELECT dt, admissions, ROUND(moving_avg::numeric, 2) AS moving_avg
+    SELECT to_char(dt, 'YYYY-MM-DD') AS date, admissions,
+           COALESCE(ROUND(moving_avg::numeric, 2), 0)::float8 AS moving_avg_7d
     FROM with_ma
     ORDER BY dt
     """
-    rows = db.execute(text(q), params).fetchall()
-    return [{"date": str(r.dt), "admissions": r.admissions, "moving_avg_7d": float(r.moving_avg or 0)} for r in rows]
+    # Coercion happens in SQL, so each row maps straight to the response dict.
+    result = await db.execute(sql(q), params)
+    return [dict(m) for m in result.mappings()]
 
 
-def get_occupancy_forecast_simple(
-    db: Session,
+async def get_occupancy_forecast_simple(
+    db: AsyncSession,
     branch_id: Optional[int] = None,
     days_lookback: int = 14,
     occupancy_threshold_pct: float = 85,
@@ -65,7 +78,7 @@ def get_occupancy_forecast_simple(
                AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) AS avg_occupancy_pct
         FROM resource_allocation ra
         JOIN hospital_branches b ON b.branch_id = ra.branch_id
-        WHERE ra.record_date >= CURRENT_DATE - :days_lookback
+        WHERE ra.record_date >= CURRENT_DATE - CAST(:days_lookback AS int)
         {branch_clause}
         GROUP BY ra.branch_id, b.name, ra.record_date
     ),
@@ -74,27 +87,20 @@ def get_occupancy_forecast_simple(
                AVG(avg_occupancy_pct) OVER (PARTITION BY branch_id ORDER BY record_date ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS ma_7d
         FROM daily_occ
     )
-    SELECT branch_name, record_date, ROUND(avg_occupancy_pct::numeric, 2) AS occupancy_pct,
-           ROUND(ma_7d::numeric, 2) AS moving_avg_7d,
+    SELECT branch_name, to_char(record_date, 'YYYY-MM-DD') AS record_date,
+           COALESCE(ROUND(avg_occupancy_pct::numeric, 2), 0)::float8 AS occupancy_pct,
+           COALESCE(ROUND(ma_7d::numeric, 2), 0)::float8 AS moving_avg_7d,
            CASE WHEN avg_occupancy_pct >= :threshold THEN true ELSE false END AS above_threshold
     FROM with_ma
-    ORDER BY branch_id, record_date
+    ORDER BY branch_id, with_ma.record_date
     """
-    rows = db.execute(text(q), params).fetchall()
-    return [
-        {
-            "branch_name": r.branch_name,
-            "record_date": str(r.record_date),
-            "occupancy_pct": float(r.occupancy_pct or 0),
-            "moving_avg_7d": float(r.moving_avg_7d or 0),
-            "above_threshold": r.above_threshold,
-        }
-        for r in rows
-    ]
-
-
-def get_threshold_alerts(
-    db: Session,
+    result = await db.execute(sql(q), params)
+    return [dict(m) for m in result.mappings()]
+
+
+@cached(_cache)
+async def get_threshold_alerts(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     bed_occupancy_threshold_pct: float = 85,
     icu_occupancy_threshold_pct: float = 90,
@@ -111,41 +117,40 @@ def get_threshold_alerts(
     if not date_from:
         date_from = date_to - timedelta(days=7)
     params = {"date_from": date_from, "date_to": date_to, "bed_threshold": bed_occupancy_threshold_pct, "icu_threshold": icu_occupancy_threshold_pct, "doc_threshold": doctor_utilization_threshold_pct}
-    branch_clause_ra = " AND ra.branch_id = ANY(:branch_ids)" if branch_ids else ""
-    branch_clause_doc = " AND d.branch_id = ANY(:branch_ids)" if branch_ids else ""
+    branch_clause_ra = " AND m.branch_id IN :branch_ids" if branch_ids else ""
+    branch_clause_doc = " AND d.branch_id IN :branch_ids" if branch_ids else ""
     if branch_ids:
-        params["branch_ids"] = branch_ids
+        params["branch_ids"] = id_list(branch_ids)
 
     alerts = []
 
+    # Thresholds are applied per request to the daily roll-ups in mv_resource_daily and
+    # mv_doctor_slots_daily (refreshed after ETL), so each check is an indexed range read.
+
     # Bed occupancy alert
     q_bed = f"""
-    SELECT ra.branch_id, b.name AS branch_name, ra.record_date,
-           AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) AS occ_pct
-    FROM resource_allocation ra
-    JOIN hospital_branches b ON b.branch_id = ra.branch_id
-    WHERE ra.record_date >= :date_from AND ra.record_date <= :date_to
+    SELECT m.branch_id, b.name AS branch_name, m.record_date, m.bed_occ_pct AS occ_pct
+    FROM mv_resource_daily m
+    JOIN hospital_branches b ON b.branch_id = m.branch_id
+    WHERE m.record_date >= :date_from AND m.record_date <= :date_to
     {branch_clause_ra}
-    GROUP BY ra.branch_id, b.name, ra.record_date
-    HAVING AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) >= :bed_threshold
+    AND m.bed_occ_pct >= :bed_threshold
     ORDER BY occ_pct DESC
     """
-    for r in db.execute(text(q_bed), params).fetchall():
+    for r in (await db.execute(sql(q_bed), params)).fetchall():
         alerts.append({"alert_type": "high_bed_occupancy", "severity": "warning", "branch_id": r.branch_id, "branch_name": r.branch_name, "record_date": str(r.record_date), "value_pct": float(r.occ_pct), "threshold_pct": bed_occupancy_threshold_pct, "message": f"Bed occupancy at {r.branch_name} on {r.record_date} was {float(r.occ_pct):.1f}% (threshold {bed_occupancy_threshold_pct}%)."})
 
     # ICU utilization alert
     q_icu = f"""
-    SELECT ra.branch_id, b.name AS branch_name, ra.record_date,
-           AVG(ra.icu_occupied * 100.0 / NULLIF(b.icu_beds, 0)) AS icu_pct
-    FROM resource_allocation ra
-    JOIN hospital_branches b ON b.branch_id = ra.branch_id
-    WHERE ra.record_date >= :date_from AND ra.record_date <= :date_to
+    SELECT m.branch_id, b.name AS branch_name, m.record_date, m.icu_occ_pct AS icu_pct
+    FROM mv_resource_daily m
+    JOIN hospital_branches b ON b.branch_id = m.branch_id
+    WHERE m.record_date >= :date_from AND m.record_date <= :date_to
     AND b.icu_beds > 0
     {branch_clause_ra}
-    GROUP BY ra.branch_id, b.name, ra.record_date
-    HAVING AVG(ra.icu_occupied * 100.0 / NULLIF(b.icu_beds, 0)) >= :icu_threshold
+    AND m.icu_occ_pct >= :icu_threshold
     """
-    for r in db.execute(text(q_icu), params).fetchall():
+    for r in (await db.execute(sql(q_icu), params)).fetchall():
         alerts.append({"alert_type": "high_icu_utilization", "severity": "warning", "branch_id": r.branch_id, "branch_name": r.branch_name, "record_date": str(r.record_date), "value_pct": float(r.icu_pct), "threshold_pct": icu_occupancy_threshold_pct, "message": f"ICU utilization at {r.branch_name} on {r.record_date} was {float(r.icu_pct):.1f}%."})
 
     # Doctor overutilization (avg utilization > threshold in period)
@@ -153,11 +158,10 @@ def get_threshold_alerts(
     SELECT d.branch_id, b.name AS branch_name,
            AVG(util.util_pct) AS avg_util_pct
     FROM (
-        SELECT doc.department_id, COUNT(*) FILTER (WHERE ds.is_booked) * 100.0 / NULLIF(COUNT(*), 0) AS util_pct
-        FROM doctor_schedules ds
-        JOIN doctors doc ON doc.doctor_id = ds.doctor_id
-        WHERE ds.slot_date >= :date_from AND ds.slot_date <= :date_to
-        GROUP BY doc.doctor_id, doc.department_id
+        SELECT m.department_id, SUM(m.booked_slots) * 100.0 / NULLIF(SUM(m.slots), 0) AS util_pct
+        FROM mv_doctor_slots_daily m
+        WHERE m.slot_date >= :date_from AND m.slot_date <= :date_to
+        GROUP BY m.doctor_id, m.department_id
     ) util
     JOIN departments d ON d.department_id = util.department_id
     JOIN hospital_branches b ON b.branch_id = d.branch_id
@@ -165,7 +169,7 @@ def get_threshold_alerts(
     GROUP BY d.branch_id, b.name
     HAVING AVG(util.util_pct) >= :doc_threshold
     """
-    for r in db.execute(text(q_doc), params).fetchall():
+    for r in (await db.execute(sql(q_doc), params)).fetchall():
         alerts.append({"alert_type": "doctor_overutilization", "severity": "info", "branch_id": r.branch_id, "branch_name": r.branch_name, "value_pct": float(r.avg_util_pct), "threshold_pct": doctor_utilization_threshold_pct, "message": f"Doctor utilization at {r.branch_name} averaged {float(r.avg_util_pct):.1f}% (threshold {doctor_utilization_threshold_pct}%)."})
 
     return alerts
@@ -2,14 +2,73 @@
 Trend analysis (daily, weekly, monthly, quarterly) for dashboard.
 """
 from datetime import date, timedelta
+from functools import lru_cache
 from typing import Optional, List
 
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
+from app.services._common import cached, id_list, set_local_work_mem, sql
 
-def get_trends(
-    db: Session,
+# Dashboards re-request the same windows (e.g. last 90 days); repeats within a minute are served from memory.
+_cache = TTLCache(maxsize=512, ttl=60)
+
+
+def clear_cache() -> None:
+    """Drop cached trend and branch comparison results (call after data changes)."""
+    _cache.clear()
+
+
+def _period_label(granularity: str, period_dt: date) -> str:
+    """Display label for a period start: 2026-03-02 (daily/weekly), 2026-03, 2026-1 (quarterly)."""
+    if granularity == "monthly":
+        return period_dt.strftime("%Y-%m")
+    if granularity == "quarterly":
+        return f"{period_dt.year}-{(period_dt.month - 1) // 3 + 1}"
+    return period_dt.strftime("%Y-%m-%d")
+
+
+@lru_cache(maxsize=None)
+def _trends_statement(has_branches: bool, has_depts: bool) -> TextClause:
+    """Trend statement for one filter shape; the same text every call, so asyncpg reuses its prepared statement."""
+    branch_clause = " AND m.branch_id IN :branch_ids" if has_branches else ""
+    dept_clause = " AND m.department_id IN :department_ids" if has_depts else ""
+
+    # Discharged admissions and LOS roll up from the daily aggregates in mv_kpi_summary_daily
+    # (refreshed after ETL/seed); occupancy per period comes from the daily branch averages in
+    # mv_resource_daily and is joined in the same round trip.
+    return sql(f"""
+    WITH adm_agg AS (
+        SELECT date_trunc(CAST(:trunc AS text), m.admission_date::timestamp)::date AS period_dt,
+               SUM(m.discharges)::bigint AS discharges,
+               SUM(m.los_days_sum) / NULLIF(SUM(m.discharges), 0) AS avg_los
+        FROM mv_kpi_summary_daily m
+        WHERE m.admission_date >= :date_from
+          AND m.admission_date <= :date_to
+          {branch_clause} {dept_clause}
+        GROUP BY 1
+        HAVING SUM(m.discharges) > 0
+    ),
+    occ_agg AS (
+        SELECT date_trunc(CAST(:trunc AS text), r.record_date::timestamp)::date AS period_dt,
+               AVG(r.bed_occ_pct) AS occ_pct
+        FROM mv_resource_daily r
+        WHERE r.record_date >= :date_from
+          AND r.record_date <= :date_to
+          {branch_clause.replace("m.", "r.")}
+        GROUP BY 1
+    )
+    SELECT period_dt, adm_agg.discharges, adm_agg.avg_los, occ_agg.occ_pct
+    FROM adm_agg
+    LEFT JOIN occ_agg USING (period_dt)
+    ORDER BY period_dt
+    """)
+
+
+@cached(_cache)
+async def get_trends(
+    db: AsyncSession,
     granularity: str,  # daily, weekly, monthly, quarterly
     branch_ids: Optional[List[int]] = None,
     department_ids: Optional[List[int]] = None,
@@ -23,100 +82,70 @@ def get_trends(
 
     params = {"date_from": date_from, "date_to": date_to}
 
-    branch_clause = " AND a.branch_id = ANY(:branch_ids)" if branch_ids else ""
-    dept_clause = " AND a.department_id = ANY(:department_ids)" if department_ids else ""
-
     if branch_ids:
-        params["branch_ids"] = branch_ids
+        params["branch_ids"] = id_list(branch_ids)
     if department_ids:
-        params["department_ids"] = department_ids
-
-    # Period grouping for admissions
-    if granularity == "daily":
-        period_expr = "date_trunc('day', adm.admission_at)::date"
-        period_label = "to_char(adm.admission_at, 'YYYY-MM-DD')"
-    elif granularity == "weekly":
-        period_expr = "date_trunc('week', adm.admission_at)::date"
-        period_label = "to_char(date_trunc('week', adm.admission_at), 'YYYY-MM-DD')"
-    elif granularity == "monthly":
-        period_expr = "date_trunc('month', adm.admission_at)::date"
-        period_label = "to_char(date_trunc('month', adm.admission_at), 'YYYY-MM')"
-    else:  # quarterly
-        period_expr = "date_trunc('quarter', adm.admission_at)::date"
-        period_label = "to_char(date_trunc('quarter', adm.admission_at), 'YYYY-Q')"
-
-    q = f"""
-    WITH adm AS (
-        SELECT a.admission_id, a.admission_at,
-               d.discharge_at,
-               EXTRACT(EPOCH FROM (d.discharge_at - a.admission_at))/86400 AS los_days
-        FROM admissions a
-        JOIN discharges d ON d.admission_id = a.admission_id
-        WHERE a.admission_at >= :date_from
-          AND a.admission_at < :date_to + interval '1 day'
-          {branch_clause} {dept_clause}
-    ),
-    by_period AS (
-        SELECT {period_expr} AS period_dt,
-               {period_label} AS period_label,
-               COUNT(*) AS admissions,
-               AVG(los_days) AS avg_los
-        FROM adm
-        GROUP BY 1, 2
-    )
-    SELECT period_label, period_dt, admissions, avg_los
-    FROM by_period
-    ORDER BY period_dt
-    """
-
-    rows = db.execute(text(q), params).fetchall()
-
-    # Occupancy by period (from resource_allocation)
-    try:
-        if granularity == "daily":
-            occ_label = "to_char(ra.record_date, 'YYYY-MM-DD')"
-        elif granularity == "weekly":
-            occ_label = "to_char(date_trunc('week', ra.record_date), 'YYYY-MM-DD')"
-        elif granularity == "monthly":
-            occ_label = "to_char(date_trunc('month', ra.record_date), 'YYYY-MM')"
-        else:  # quarterly
-            occ_label = "to_char(date_trunc('quarter', ra.record_date), 'YYYY-Q')"
-
-        occ_q = f"""
-        SELECT {occ_label} AS period_label,
-               AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) AS occ_pct
-        FROM resource_allocation ra
-        JOIN hospital_branches b ON b.branch_id = ra.branch_id
-        WHERE ra.record_date >= :date_from
-          AND ra.record_date <= :date_to
-          {" AND ra.branch_id = ANY(:branch_ids)" if branch_ids else ""}
-        GROUP BY 1
-        ORDER BY 1
-        """
+        params["department_ids"] = id_list(department_ids)
 
-        occ_rows = {
-            r.period_label: float(r.occ_pct or 0)
-            for r in db.execute(text(occ_q), params).fetchall()
-        }
-    except Exception:
-        occ_rows = {}
+    # Group on the truncated day alone; labels are formatted in Python (_period_label)
+    params["trunc"] = {"weekly": "week", "monthly": "month", "quarterly": "quarter"}.get(granularity, "day")
+
+    await set_local_work_mem(db)
+    rows = (await db.execute(_trends_statement(bool(branch_ids), bool(department_ids)), params)).fetchall()
 
     result = []
     for r in rows:
         result.append({
-            "period": r.period_label,
+            "period": _period_label(granularity, r.period_dt),
             "period_dt": str(r.period_dt) if r.period_dt else None,
-            "admissions": r.admissions,
-            "discharges": r.admissions,  # same count for now
+            # Periods are built from discharged admissions (LOS needs a discharge), so both counts are the same column
+            "admissions": r.discharges,
+            "discharges": r.discharges,
             "avg_los_days": round(float(r.avg_los or 0), 2),
-            "occupancy_pct": round(occ_rows.get(r.period_label, 0), 2),
+            "occupancy_pct": round(float(r.occ_pct or 0), 2),
         })
 
     return result
 
 
-def get_department_comparison(
-    db: Session,
+@lru_cache(maxsize=None)
+def _department_statement(has_branches: bool) -> TextClause:
+    branch_clause = " AND a.branch_id IN :branch_ids" if has_branches else ""
+    return sql(f"""
+    SELECT d.code,
+           d.name AS department_name,
+           MAX(b.name) AS branch_name,
+           COUNT(a.admission_id) AS admissions,
+           COUNT(dis.admission_id) AS discharges,
+           AVG(dis.los_days) AS avg_los,
+           COALESCE(MAX(pv.procedure_volume), 0) AS procedure_volume,
+           COUNT(*) FILTER (WHERE a.admission_type = 'Emergency') AS emergency_count
+    FROM departments d
+    JOIN hospital_branches b ON b.branch_id = d.branch_id
+    LEFT JOIN admissions a
+           ON a.department_id = d.department_id
+          AND a.admission_at >= :date_from
+          AND a.admission_at < CAST(:date_to AS date) + interval '1 day'
+          {branch_clause}
+    LEFT JOIN discharges dis ON dis.admission_id = a.admission_id
+    -- Procedure counts aggregated once for all departments, not re-scanned per department
+    LEFT JOIN (
+        SELECT a2.department_id, COUNT(*) AS procedure_volume
+        FROM procedures p
+        JOIN admissions a2 ON a2.admission_id = p.admission_id
+        WHERE a2.admission_at >= :date_from
+          AND a2.admission_at < CAST(:date_to AS date) + interval '1 day'
+          {branch_clause.replace('a.', 'a2.')}
+        GROUP BY a2.department_id
+    ) pv ON pv.department_id = d.department_id
+    -- Keyed on the INT primary key; code/name are functionally dependent on it
+    GROUP BY d.department_id
+    ORDER BY admissions DESC, d.department_id
+    """)
+
+
+async def get_department_comparison(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
@@ -128,39 +157,11 @@ def get_department_comparison(
 
     params = {"date_from": date_from, "date_to": date_to}
 
-    branch_clause = " AND a.branch_id = ANY(:branch_ids)" if branch_ids else ""
     if branch_ids:
-        params["branch_ids"] = branch_ids
+        params["branch_ids"] = id_list(branch_ids)
 
-    q = f"""
-    SELECT d.code,
-           d.name AS department_name,
-           b.name AS branch_name,
-           COUNT(a.admission_id) AS admissions,
-           AVG(EXTRACT(EPOCH FROM (dis.discharge_at - a.admission_at))/86400) AS avg_los,
-           (
-             SELECT COUNT(*)
-             FROM procedures p
-             JOIN admissions a2 ON a2.admission_id = p.admission_id
-             WHERE a2.department_id = d.department_id
-               AND a2.admission_at >= :date_from
-               AND a2.admission_at < :date_to + interval '1 day'
-               {branch_clause.replace('a.', 'a2.')}
-           ) AS procedure_volume,
-           COUNT(*) FILTER (WHERE a.admission_type = 'Emergency') AS emergency_count
-    FROM departments d
-    JOIN hospital_branches b ON b.branch_id = d.branch_id
-    LEFT JOIN admissions a
-           ON a.department_id = d.department_id
-          AND a.admission_at >= :date_from
-          AND a.admission_at < :date_to + interval '1 day'
-          {branch_clause}
-    LEFT JOIN discharges dis ON dis.admission_id = a.admission_id
-    GROUP BY d.department_id, d.code, d.name, b.name
-    ORDER BY admissions DESC
-    """
-
-    rows = db.execute(text(q), params).fetchall()
+    await set_local_work_mem(db)
+    rows = (await db.execute(_department_statement(bool(branch_ids)), params)).fetchall()
 
     return [
         {
@@ -168,7 +169,7 @@ def get_department_comparison(
             "department_name": r.department_name,
             "branch_name": r.branch_name,
             "admissions": r.admissions,
-            "discharges": r.admissions,
+            "discharges": r.discharges,
             "avg_los_days": round(float(r.avg_los or 0), 2),
             "procedure_volume": r.procedure_volume or 0,
             "emergency_count": r.emergency_count or 0,
@@ -177,8 +178,67 @@ def get_department_comparison(
     ]
 
 
-def get_branch_comparison(
-    db: Session,
+# Admissions in range are filtered once (adm) and shared by the per-branch aggregates,
+# instead of each correlated sub-query re-scanning admissions for every branch.
+_BRANCH_COMPARISON = sql("""
+    WITH adm AS MATERIALIZED (
+        SELECT admission_id, branch_id, admission_at
+        FROM admissions
+        WHERE admission_at >= :date_from
+          AND admission_at < CAST(:date_to AS date) + interval '1 day'
+    ),
+    stay AS (
+        SELECT a.branch_id,
+               COUNT(*) AS admissions,
+               COUNT(d.admission_id) AS discharges,
+               AVG(d.los_days) AS avg_los
+        FROM adm a
+        LEFT JOIN discharges d ON d.admission_id = a.admission_id
+        GROUP BY a.branch_id
+    ),
+    cost AS (
+        SELECT a.branch_id,
+               SUM(bill.total_amount) / NULLIF(COUNT(DISTINCT bill.admission_id), 0) AS cost_per_discharge
+        FROM billing bill
+        JOIN adm a ON a.admission_id = bill.admission_id
+        GROUP BY a.branch_id
+    ),
+    readm AS (
+        SELECT a.branch_id, COUNT(*) AS readm_count
+        FROM adm a
+        WHERE EXISTS (SELECT 1 FROM readmissions r WHERE r.previous_admission_id = a.admission_id)
+        GROUP BY a.branch_id
+    )
+    SELECT b.branch_id,
+           b.name AS branch_name,
+           b.city,
+           COALESCE(stay.admissions, 0) AS admissions,
+           COALESCE(stay.discharges, 0) AS discharges,
+           stay.avg_los,
+           cost.cost_per_discharge,
+           COALESCE(readm.readm_count, 0) AS readm_count,
+           COALESCE(stay.admissions, 0) AS total_adm
+    FROM hospital_branches b
+    LEFT JOIN stay ON stay.branch_id = b.branch_id
+    LEFT JOIN cost ON cost.branch_id = b.branch_id
+    LEFT JOIN readm ON readm.branch_id = b.branch_id
+    ORDER BY b.branch_id
+    """)
+
+# Mean of the daily averages in mv_resource_daily (one row per branch-day, not 24 hourly rows)
+_BRANCH_OCCUPANCY = sql("""
+    SELECT r.branch_id,
+           AVG(r.bed_occ_pct) AS occ_pct
+    FROM mv_resource_daily r
+    WHERE r.record_date >= :date_from
+      AND r.record_date <= :date_to
+    GROUP BY r.branch_id
+    """)
+
+
+@cached(_cache)
+async def get_branch_comparison(
+    db: AsyncSession,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
 ) -> List[dict]:
@@ -189,61 +249,12 @@ def get_branch_comparison(
 
     params = {"date_from": date_from, "date_to": date_to}
 
-    q = """
-    SELECT b.branch_id,
-           b.name AS branch_name,
-           b.city,
-           COUNT(a.admission_id) AS admissions,
-           AVG(EXTRACT(EPOCH FROM (d.discharge_at - a.admission_at))/86400) AS avg_los,
-           (
-             SELECT COALESCE(SUM(bill.total_amount), 0)
-                    / NULLIF(COUNT(DISTINCT bill.admission_id), 0)
-             FROM billing bill
-             JOIN admissions a2 ON a2.admission_id = bill.admission_id
-             WHERE a2.branch_id = b.branch_id
-               AND a2.admission_at >= :date_from
-               AND a2.admission_at < :date_to + interval '1 day'
-           ) AS cost_per_discharge,
-           (
-             SELECT COUNT(DISTINCT r.previous_admission_id)
-             FROM readmissions r
-             JOIN admissions a3 ON a3.admission_id = r.previous_admission_id
-             WHERE a3.branch_id = b.branch_id
-               AND a3.admission_at >= :date_from
-               AND a3.admission_at < :date_to + interval '1 day'
-           ) AS readm_count,
-           (
-             SELECT COUNT(*)
-             FROM admissions a4
-             WHERE a4.branch_id = b.branch_id
-               AND a4.admission_at >= :date_from
-               AND a4.admission_at < :date_to + interval '1 day'
-           ) AS total_adm
-    FROM hospital_branches b
-    LEFT JOIN admissions a
-           ON a.branch_id = b.branch_id
-          AND a.admission_at >= :date_from
-          AND a.admission_at < :date_to + interval '1 day'
-    LEFT JOIN discharges d ON d.admission_id = a.admission_id
-    GROUP BY b.branch_id, b.name, b.city
-    ORDER BY b.branch_id
-    """
-
-    rows = db.execute(text(q), params).fetchall()
-
-    occ_q = """
-    SELECT ra.branch_id,
-           AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) AS occ_pct
-    FROM resource_allocation ra
-    JOIN hospital_branches b ON b.branch_id = ra.branch_id
-    WHERE ra.record_date >= :date_from
-      AND ra.record_date <= :date_to
-    GROUP BY ra.branch_id
-    """
+    await set_local_work_mem(db)
+    rows = (await db.execute(_BRANCH_COMPARISON, params)).fetchall()
 
     occ_map = {
         r.branch_id: float(r.occ_pct or 0)
-        for r in db.execute(text(occ_q), params).fetchall()
+        for r in (await db.execute(_BRANCH_OCCUPANCY, params)).fetchall()
     }
 
     result = []
@@ -257,18 +268,48 @@ def get_branch_comparison(
             "branch_name": r.branch_name,
             "city": r.city,
             "admissions": r.admissions,
-            "discharges": r.admissions,
+            "discharges": r.discharges,
             "avg_los_days": round(float(r.avg_los or 0), 2),
             "cost_per_discharge_inr": round(cost, 2),
             "readmission_rate_pct": round(readm_rate, 2),
-            "bed_occupancy_pct": round(occ_map.get(r.branch_id, 0), 2),
+            "bed_occupancy_pct": round(occ_map.get(r.branch_id, 0.0), 2),
         })
 
     return result
 
 
-def get_peak_hours(
-    db: Session,
+@lru_cache(maxsize=None)
+def _peak_hours_statement(has_branches: bool, by_day_of_week: bool) -> TextClause:
+    branch_clause = " AND m.branch_id IN :branch_ids" if has_branches else ""
+
+    # Hour and day come precomputed from mv_admissions_hourly (refreshed after ETL/seed), so the
+    # range filter is an index read on dt and nothing is extracted per admission row.
+    if by_day_of_week:
+        return sql(f"""
+        SELECT EXTRACT(DOW FROM m.dt)::int AS day_of_week,
+               m.hour,
+               SUM(m.admissions)::bigint AS admissions_count
+        FROM mv_admissions_hourly m
+        WHERE m.dt >= :date_from
+          AND m.dt <= :date_to
+          {branch_clause}
+        GROUP BY 1, 2
+        ORDER BY admissions_count DESC
+        """)
+    return sql(f"""
+    SELECT m.hour,
+           SUM(m.admissions)::bigint AS admissions_count
+    FROM mv_admissions_hourly m
+    WHERE m.dt >= :date_from
+      AND m.dt <= :date_to
+      {branch_clause}
+    GROUP BY m.hour
+    ORDER BY admissions_count DESC
+    """)
+
+
+async def get_peak_hours(
+    db: AsyncSession,
     branch_ids: Optional[List[int]] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
@@ -281,35 +322,10 @@ def get_peak_hours(
 
     params = {"date_from": date_from, "date_to": date_to}
 
-    branch_clause = " AND a.branch_id = ANY(:branch_ids)" if branch_ids else ""
     if branch_ids:
-        params["branch_ids"] = branch_ids
-
-    if by_day_of_week:
-        q = f"""
-        SELECT EXTRACT(DOW FROM a.admission_at)::int AS day_of_week,
-               EXTRACT(HOUR FROM a.admission_at)::int AS hour,
-               COUNT(*) AS admissions_count
-        FROM admissions a
-        WHERE a.admission_at >= :date_from
-          AND a.admission_at < :date_to + interval '1 day'
-          {branch_clause}
-        GROUP BY 1, 2
-        ORDER BY admissions_count DESC
-        """
-    else:
-        q = f"""
-        SELECT EXTRACT(HOUR FROM a.admission_at)::int AS hour,
-               COUNT(*) AS admissions_count
-        FROM admissions a
-        WHERE a.admission_at >= :date_from
-          AND a.admission_at < :date_to + interval '1 day'
-          {branch_clause}
-        GROUP BY 1
-        ORDER BY admissions_count DESC
-        """
+        params["branch_ids"] = id_list(branch_ids)
 
-    rows = db.execute(text(q), params).fetchall()
+    rows = (await db.execute(_peak_hours_statement(bool(branch_ids), by_day_of_week), params)).fetchall()
 
     return [
         {
@@ -109,6 +109,8 @@ CREATE TABLE IF NOT EXISTS discharges (
     discharge_at    TIMESTAMPTZ NOT NULL,
     outcome_id     INT REFERENCES outcomes(outcome_id),
     outcome_code    VARCHAR(30) NOT NULL,  -- denormalized for queries; matches outcomes.code
+    admission_at    TIMESTAMPTZ,           -- copied from admissions by trg_discharges_admission_at
+    los_days        NUMERIC GENERATED ALWAYS AS (EXTRACT(EPOCH FROM (discharge_at - admission_at)) / 86400) STORED,
     created_at     TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -169,6 +171,39 @@ CREATE TABLE IF NOT EXISTS readmissions (
     created_at      TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Length of stay, stored on discharges so queries and indexes use it directly.
+-- A generated column cannot read admissions, so admission_at is kept in sync by triggers.
+ALTER TABLE discharges ADD COLUMN IF NOT EXISTS admission_at TIMESTAMPTZ;
+ALTER TABLE discharges ADD COLUMN IF NOT EXISTS los_days NUMERIC
+    GENERATED ALWAYS AS (EXTRACT(EPOCH FROM (discharge_at - admission_at)) / 86400) STORED;
+
+CREATE OR REPLACE FUNCTION discharges_set_admission_at() RETURNS trigger AS $$
+BEGIN
+    SELECT a.admission_at INTO NEW.admission_at FROM admissions a WHERE a.admission_id = NEW.admission_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_discharges_admission_at
+    BEFORE INSERT OR UPDATE OF admission_id ON discharges
+    FOR EACH ROW EXECUTE FUNCTION discharges_set_admission_at();
+
+CREATE OR REPLACE FUNCTION admissions_sync_discharge_admission_at() RETURNS trigger AS $$
+BEGIN
+    UPDATE discharges SET admission_at = NEW.admission_at WHERE admission_id = NEW.admission_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_admissions_admission_at
+    AFTER UPDATE OF admission_at ON admissions
+    FOR EACH ROW EXECUTE FUNCTION admissions_sync_discharge_admission_at();
+
+-- Backfill rows loaded before the column existed (no-op once in sync).
+UPDATE discharges dis SET admission_at = a.admission_at
+FROM admissions a
+WHERE a.admission_id = dis.admission_id AND dis.admission_at IS DISTINCT FROM a.admission_at;
+
 -- Optional: FK from beds to admissions (add after admissions exists)
 -- ALTER TABLE beds ADD CONSTRAINT fk_beds_admission FOREIGN KEY (admission_id) REFERENCES admissions(admission_id);
 
@@ -182,13 +217,26 @@ CREATE INDEX IF NOT EXISTS idx_admissions_patient ON admissions(patient_id);
 CREATE INDEX IF NOT EXISTS idx_admissions_type ON admissions(admission_type);
 CREATE INDEX IF NOT EXISTS idx_discharges_discharge_at ON discharges(discharge_at);
 CREATE INDEX IF NOT EXISTS idx_discharges_outcome ON discharges(outcome_code);
+CREATE INDEX IF NOT EXISTS idx_discharges_long_stay ON discharges(los_days) WHERE los_days > 14;
 CREATE INDEX IF NOT EXISTS idx_procedures_performed_at ON procedures(performed_at);
 CREATE INDEX IF NOT EXISTS idx_procedures_admission ON procedures(admission_id);
-CREATE INDEX IF NOT EXISTS idx_billing_admission ON billing(admission_id);
+CREATE INDEX IF NOT EXISTS idx_readmissions_previous_admission ON readmissions(previous_admission_id);
 CREATE INDEX IF NOT EXISTS idx_doctor_schedules_doctor_date ON doctor_schedules(doctor_id, slot_date);
 CREATE INDEX IF NOT EXISTS idx_resource_allocation_branch_date ON resource_allocation(branch_id, record_date, record_hour);
 CREATE INDEX IF NOT EXISTS idx_beds_branch_dept ON beds(branch_id, department_id);
 
+-- Covering indexes matching the KPI filters (date range first, then branch/department);
+-- INCLUDE columns let the planner answer the joins with index-only scans.
+CREATE INDEX IF NOT EXISTS idx_admissions_at_branch_dept ON admissions(admission_at, branch_id, department_id) INCLUDE (admission_id, admission_type);
+-- Replaces idx_billing_admission (same key).
+CREATE INDEX IF NOT EXISTS idx_billing_admission_cov ON billing(admission_id) INCLUDE (total_amount);
+DROP INDEX IF EXISTS idx_billing_admission;
+CREATE INDEX IF NOT EXISTS idx_resource_allocation_date_branch ON resource_allocation(record_date, branch_id) INCLUDE (beds_occupied, icu_occupied, ventilators_used);
+CREATE INDEX IF NOT EXISTS idx_doctor_schedules_date_doctor ON doctor_schedules(slot_date, doctor_id) INCLUDE (is_booked);
+-- Refresh planner statistics so the new indexes are considered straight away
+-- (VACUUM cannot run inside the schema script's transaction; autovacuum handles it).
+ANALYZE admissions, discharges, billing, resource_allocation, doctor_schedules;
+
 -- =============================================================================
 -- KPI VIEWS (Validated definitions for reporting and API)
 -- Formulas documented in comments and README.
@@ -205,7 +253,7 @@ SELECT
     date_trunc('day', a.admission_at)::date AS period_date,
     date_trunc('month', a.admission_at)::date AS period_month,
     COUNT(*) AS discharge_count,
-    ROUND((AVG(EXTRACT(EPOCH FROM (dis.discharge_at - a.admission_at)) / 86400))::numeric, 2) AS alos_days
+    ROUND(AVG(dis.los_days)::numeric, 2) AS alos_days
 FROM admissions a
 JOIN discharges dis ON dis.admission_id = a.admission_id
 JOIN hospital_branches b ON b.branch_id = a.branch_id
@@ -257,13 +305,16 @@ SELECT
     a.branch_id,
     b.name AS branch_name,
     date_trunc('month', dis.discharge_at)::date AS period_month,
-    COUNT(DISTINCT dis.admission_id) AS total_discharges,
-    COUNT(DISTINCT r.previous_admission_id) AS readmissions_30d,
-    ROUND((COUNT(DISTINCT r.previous_admission_id) * 100.0 / NULLIF(COUNT(DISTINCT dis.admission_id), 0))::numeric, 2) AS readmission_rate_pct
+    COUNT(*) AS total_discharges,
+    COUNT(*) FILTER (WHERE r.readmitted) AS readmissions_30d,
+    ROUND((COUNT(*) FILTER (WHERE r.readmitted) * 100.0 / NULLIF(COUNT(*), 0))::numeric, 2) AS readmission_rate_pct
 FROM admissions a
 JOIN discharges dis ON dis.admission_id = a.admission_id
 JOIN hospital_branches b ON b.branch_id = a.branch_id
-LEFT JOIN readmissions r ON r.previous_admission_id = dis.admission_id
+-- One row per discharge (discharges.admission_id is unique); a semi-join flag replaces COUNT(DISTINCT).
+CROSS JOIN LATERAL (
+    SELECT EXISTS (SELECT 1 FROM readmissions r WHERE r.previous_admission_id = dis.admission_id) AS readmitted
+) r
 GROUP BY a.branch_id, b.name, date_trunc('month', dis.discharge_at)::date;
 
 -- View: Procedure Volume (by period, branch, department)
@@ -393,7 +444,7 @@ CREATE OR REPLACE VIEW v_kpi_executive_snapshot AS
 WITH adm AS (
     SELECT a.admission_id, a.branch_id, a.department_id, a.admission_type, a.admission_at,
            dis.discharge_at, dis.outcome_code,
-           EXTRACT(EPOCH FROM (dis.discharge_at - a.admission_at))/86400 AS los_days
+           dis.los_days
     FROM admissions a
     JOIN discharges dis ON dis.admission_id = a.admission_id
 )
@@ -407,3 +458,107 @@ SELECT
 FROM adm
 GROUP BY date_trunc('month', admission_at)::date
 ORDER BY 1;
+
+-- =============================================================================
+-- MATERIALIZED KPI AGGREGATES (read by the API; refreshed after ETL/seed)
+-- =============================================================================
+
+-- Daily KPI building blocks per branch/department/admission day. Every measure is
+-- additive (sums and counts; readmitted/billed admissions are counted once per
+-- admission), so any date range or filter rolls up with SUM().
+-- Refresh (all mv_*): REFRESH MATERIALIZED VIEW CONCURRENTLY, via POST /api/etl/refresh-views.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_kpi_summary_daily AS
+SELECT
+    a.branch_id,
+    a.department_id,
+    date_trunc('day', a.admission_at)::date AS admission_date,
+    COUNT(dis.admission_id) AS discharges,
+    COALESCE(SUM(dis.los_days), 0) AS los_days_sum,
+    COUNT(*) FILTER (WHERE dis.outcome_code = 'Recovered') AS outcome_recovered,
+    COUNT(*) FILTER (WHERE dis.outcome_code = 'Improved') AS outcome_improved,
+    COUNT(*) FILTER (WHERE dis.outcome_code = 'Transferred') AS outcome_transferred,
+    COUNT(*) FILTER (WHERE dis.outcome_code = 'Deceased') AS outcome_deceased,
+    COUNT(*) FILTER (WHERE dis.outcome_code NOT IN ('Recovered', 'Improved', 'Transferred', 'Deceased')) AS outcome_other,
+    COUNT(dis.admission_id) FILTER (WHERE a.admission_type = 'Emergency') AS emergency_cases,
+    COUNT(dis.admission_id) FILTER (WHERE a.admission_type IN ('Scheduled', 'Transfer')) AS scheduled_cases,
+    COALESCE(SUM(p.procedure_count), 0) AS procedure_count,
+    COUNT(r.previous_admission_id) AS readmitted_admissions,
+    COALESCE(SUM(bl.billed_amount), 0) AS billed_amount,
+    COUNT(bl.admission_id) AS billed_admissions
+FROM admissions a
+LEFT JOIN discharges dis ON dis.admission_id = a.admission_id
+LEFT JOIN (SELECT admission_id, COUNT(*) AS procedure_count FROM procedures GROUP BY admission_id) p
+       ON p.admission_id = a.admission_id
+LEFT JOIN (SELECT DISTINCT previous_admission_id FROM readmissions) r
+       ON r.previous_admission_id = a.admission_id
+LEFT JOIN (SELECT admission_id, SUM(total_amount) AS billed_amount FROM billing GROUP BY admission_id) bl
+       ON bl.admission_id = a.admission_id
+GROUP BY a.branch_id, a.department_id, date_trunc('day', a.admission_at)::date;
+
+-- Unique index: required for REFRESH ... CONCURRENTLY; also serves branch/date filters.
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_kpi_summary_daily
+    ON mv_kpi_summary_daily(branch_id, department_id, admission_date);
+CREATE INDEX IF NOT EXISTS idx_mv_kpi_summary_daily_date ON mv_kpi_summary_daily(admission_date);
+
+-- Daily admission counts per branch (all admissions, discharged or not). Backs the
+-- moving-average trend so it windows over day rows instead of scanning admissions.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_admissions_daily AS
+SELECT
+    a.branch_id,
+    date_trunc('day', a.admission_at)::date AS dt,
+    COUNT(*) AS admissions
+FROM admissions a
+GROUP BY a.branch_id, date_trunc('day', a.admission_at)::date;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_admissions_daily ON mv_admissions_daily(branch_id, dt);
+CREATE INDEX IF NOT EXISTS idx_mv_admissions_daily_dt ON mv_admissions_daily(dt);
+
+-- Alert inputs: threshold alerts and bottleneck flags apply their (request-time)
+-- thresholds to these roll-ups instead of re-aggregating the fact tables per request.
+
+-- Daily average bed / ICU occupancy per branch (resource_allocation is hourly).
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_resource_daily AS
+SELECT
+    ra.branch_id,
+    ra.record_date,
+    AVG(ra.beds_occupied * 100.0 / NULLIF(b.bed_count, 0)) AS bed_occ_pct,
+    AVG(ra.icu_occupied * 100.0 / NULLIF(b.icu_beds, 0)) AS icu_occ_pct
+FROM resource_allocation ra
+JOIN hospital_branches b ON b.branch_id = ra.branch_id
+GROUP BY ra.branch_id, ra.record_date;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_resource_daily ON mv_resource_daily(branch_id, record_date);
+CREATE INDEX IF NOT EXISTS idx_mv_resource_daily_date ON mv_resource_daily(record_date);
+
+-- Scheduled vs booked slots per doctor per day; utilisation over any range is SUM(booked) / SUM(slots).
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_doctor_slots_daily AS
+SELECT
+    ds.doctor_id,
+    doc.department_id,
+    ds.slot_date,
+    COUNT(*) AS slots,
+    COUNT(*) FILTER (WHERE ds.is_booked) AS booked_slots
+FROM doctor_schedules ds
+JOIN doctors doc ON doc.doctor_id = ds.doctor_id
+GROUP BY ds.doctor_id, doc.department_id, ds.slot_date;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_doctor_slots_daily ON mv_doctor_slots_daily(doctor_id, slot_date);
+CREATE INDEX IF NOT EXISTS idx_mv_doctor_slots_daily_date ON mv_doctor_slots_daily(slot_date);
+
+-- Admissions per branch/department/day/hour, with the long-stay (> 14 days) admissions
+-- among them. Backs the peak-hour and delayed-discharge bottleneck flags.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_admissions_hourly AS
+SELECT
+    a.branch_id,
+    a.department_id,
+    date_trunc('day', a.admission_at)::date AS dt,
+    EXTRACT(HOUR FROM a.admission_at)::int AS hour,
+    COUNT(*) AS admissions,
+    COUNT(*) FILTER (WHERE dis.los_days > 14) AS long_stays,
+    COALESCE(SUM(dis.los_days) FILTER (WHERE dis.los_days > 14), 0) AS long_stay_days_sum
+FROM admissions a
+LEFT JOIN discharges dis ON dis.admission_id = a.admission_id
+GROUP BY a.branch_id, a.department_id, date_trunc('day', a.admission_at)::date, EXTRACT(HOUR FROM a.admission_at)::int;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_admissions_hourly ON mv_admissions_hourly(branch_id, department_id, dt, hour);
+CREATE INDEX IF NOT EXISTS idx_mv_admissions_hourly_dt ON mv_admissions_hourly(dt);